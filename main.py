@@ -2,8 +2,11 @@ import os
 import re
 import sys
 import requests
+from requests.adapters import HTTPAdapter
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
+from functools import lru_cache
 
 # Import the GUI library components
 from PySide6.QtCore import QObject, QThread, Signal, Slot
@@ -13,43 +16,83 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
 
 # --- BACKEND LOGIC (Standalone Helper Functions) ---
 
-def format_time_srt(seconds: float) -> str:
-    if seconds < 0: seconds = 0
-    millis = int((seconds - int(seconds)) * 1000)
-    seconds = int(seconds)
-    minutes, seconds = divmod(seconds, 60)
-    hours, minutes = divmod(minutes, 60)
+# Upper bound on YouTube URLs fetched in parallel within a batch.
+MAX_URL_WORKERS = 8
+
+_VIDEO_ID_RE = re.compile(r"(?:v=|\/)([0-9A-Za-z_-]{11})")
+_SENTENCE_END = frozenset('.?!')
+# Sentence boundaries are the whitespace following terminal punctuation; trailing fragments are kept.
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!])\s+')
+_WHITESPACE_RE = re.compile(r'\s+')
+_LINE_BREAK_RE = re.compile(r'\s*\n\s*')
+# H:M:S with an optional fraction, or a TTML ':frames' field which is ignored.
+_TIME_RE = re.compile(r'(\d+):(\d+):(\d+)(?:[.,](\d+)|:\d+(?:\.\d+)?)?')
+# Matches one blank-line-separated SRT block. Timestamps are fixed-width, so the fields are captured as numbers directly.
+_SRT_BLOCK_RE = re.compile(r'\d+\n(\d{2}):(\d{2}):(\d{2}),(\d{3}) --> (\d{2}):(\d{2}):(\d{2}),(\d{3})\n(.*)', re.DOTALL)
+
+def format_time_srt(millis: int) -> str:
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    seconds, millis = divmod(millis, 1000)
     return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
 
-def parse_time(time_str: str) -> float:
-    time_str = time_str.replace(',', '.')
-    parts = time_str.split(':')
-    if '.' in parts[-1]:
-        seconds_ms = parts[-1].split('.')
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = int(seconds_ms[0])
-        millis = int(seconds_ms[1].ljust(3, '0'))
-        return hours * 3600 + minutes * 60 + seconds + millis / 1000.0
-    else:
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = int(parts[2])
-        return hours * 3600 + minutes * 60 + seconds
+@lru_cache(maxsize=131072)
+def parse_time(time_str: str) -> int:
+    match = _TIME_RE.fullmatch(time_str)
+    if not match: raise ValueError(f"Invalid timestamp: {time_str!r}")
+    hours, minutes, seconds, millis = match.groups()
+    millis = int((millis or '0').ljust(3, '0')[:3])
+    return int(hours) * 3_600_000 + int(minutes) * 60_000 + int(seconds) * 1000 + millis
 
 def get_video_id(url: str) -> str | None:
-    match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11})", url)
+    match = _VIDEO_ID_RE.search(url)
     return match.group(1) if match else None
 
-def write_srt_file(entries: list, output_path: str):
-    with open(output_path, "w", encoding="utf-8") as srt_file:
-        for i, entry in enumerate(entries, 1):
-            start_formatted = format_time_srt(entry['start'])
-            end_formatted = format_time_srt(entry['end'])
-            if entry['end'] < entry['start']: end_formatted = start_formatted
-            srt_file.write(f"{i}\n{start_formatted} --> {end_formatted}\n{entry['content']}\n\n")
+def parse_srt_block(block: str) -> tuple | None:
+    match = _SRT_BLOCK_RE.fullmatch(block.strip('\n'))
+    if not match: return None
+    g = match.group
+    start = int(g(1)) * 3_600_000 + int(g(2)) * 60_000 + int(g(3)) * 1000 + int(g(4))
+    end = int(g(5)) * 3_600_000 + int(g(6)) * 60_000 + int(g(7)) * 1000 + int(g(8))
+    return start, end, _LINE_BREAK_RE.sub(" ", g(9)).strip()
+
+def iter_srt_file(filepath: str, chunk_size: int = 65536):
+    """Yields (start, end, content) for each valid block, reading the file incrementally."""
+    # utf-8-sig drops the BOM that many Windows subtitle editors write.
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        pending = ''
+        for data in iter(lambda: f.read(chunk_size), ''):
+            # Everything before the last blank line is complete; the remainder waits for more data.
+            *blocks, pending = (pending + data).split('\n\n')
+            for block in blocks:
+                entry = parse_srt_block(block)
+                if entry: yield entry
+        entry = parse_srt_block(pending)
+        if entry: yield entry
+
+def write_srt_file(starts: list, ends: list, contents: list, output_path: str):
+    lines = []
+    # An entry usually starts where the previous one ended, so its formatted end time is reused.
+    prev_millis, prev_formatted = None, ""
+    for i, (start, end, content) in enumerate(zip(starts, ends, contents), 1):
+        start_millis = max(start, 0)
+        end_millis = max(end, start_millis)
+        start_formatted = prev_formatted if start_millis == prev_millis else format_time_srt(start_millis)
+        end_formatted = start_formatted if end_millis == start_millis else format_time_srt(end_millis)
+        prev_millis, prev_formatted = end_millis, end_formatted
+        lines.append(f"{i}\n{start_formatted} --> {end_formatted}\n{content}\n\n")
+    # Encode once and hand the whole buffer to the OS, bypassing the text-IO layer.
+    data = memoryview("".join(lines).encode("utf-8"))
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
 
 # --- WORKER CLASS for Threading ---
+# Raw chunks are streamed as (start, end, content) tuples; final entries are parallel `starts`, `ends` and `contents` lists.
+# All times are integer milliseconds.
 
 class Worker(QObject):
     log_message = Signal(str)
@@ -59,157 +102,150 @@ class Worker(QObject):
         super().__init__()
         self.tasks = tasks
         self.output_dir = output_dir
+        # Output paths are built by concatenation onto this separator-terminated prefix.
+        self._out_prefix = os.path.join(output_dir, '')
+        # One session for the whole batch so subtitle downloads reuse pooled keep-alive connections.
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+    def iter_logical_blocks(self, chunks):
+        """Lazily groups (start, end, content) chunks into blocks, respecting natural sentence breaks."""
+        block_start, block_end, block_parts = 0, 0, []
+        for start, end, content in chunks:
+            if not block_parts: block_start = start
+            block_parts.append(content)
+            block_end = end
+            # If the current chunk's text ends with punctuation, it's the end of a block.
+            if content.rstrip()[-1:] in _SENTENCE_END:
+                yield block_start, block_end, " ".join(block_parts)
+                block_parts = []
 
-    def enforce_no_overlap(self, entries: list):
-        """Final cleanup pass to guarantee no timestamps overlap."""
-        for i in range(len(entries) - 1):
-            current_entry = entries[i]
-            next_entry = entries[i+1]
-            if current_entry['end'] > next_entry['start']:
-                current_entry['end'] = next_entry['start']
-
-    def split_into_sentences(self, entries: list) -> list:
-        """Splits logical blocks into final, single-sentence entries."""
-        final_entries = []
-        sentence_pattern = r'([^.?!]+[.?!])'
-        for entry in entries:
-            content = entry['content'].strip()
-            sentences = [s.strip() for s in re.findall(sentence_pattern, content) if s.strip()]
-            if not sentences:
-                if content: final_entries.append(entry)
-                continue
-            if len(sentences) == 1:
-                entry['content'] = sentences[0]
-                final_entries.append(entry)
-                continue
-            
-            total_len = sum(len(s) for s in sentences)
-            if total_len == 0: continue
-
-            duration = entry['end'] - entry['start']
-            current_time = entry['start']
-            for sentence in sentences:
-                sentence_len = len(sentence)
-                sentence_duration = duration * (sentence_len / total_len) if duration > 0 and total_len > 0 else 0
-                sentence_end_time = current_time + sentence_duration
-                final_entries.append({"start": current_time, "end": sentence_end_time, "content": sentence})
-                current_time = sentence_end_time
-        return final_entries
+        # If there are any leftover chunks, create a final block from them
+        if block_parts: yield block_start, block_end, " ".join(block_parts)
 
-    def create_logical_blocks(self, chunks: list) -> list:
+    def build_final_entries(self, chunks) -> tuple:
         """
-        REVISED: Stage 1.
-        Precisely groups raw chunks into blocks, respecting natural sentence breaks.
+        Groups raw chunks into logical blocks, splits each block into single-sentence
+        entries and clamps overlapping timestamps, all in a single pass.
         """
-        logical_blocks = []
-        current_block_chunks = []
-        for chunk in chunks:
-            # Add the current chunk to our temporary block
-            current_block_chunks.append(chunk)
-            
-            # If the current chunk's text ends with punctuation, it's the end of a block.
-            if chunk['content'].strip().endswith(('.', '?', '!')):
-                content = " ".join(c['content'] for c in current_block_chunks)
-                start_time = current_block_chunks[0]['start']
-                end_time = current_block_chunks[-1]['end']
-                
-                logical_blocks.append({
-                    "start": start_time,
-                    "end": end_time,
-                    "content": content
-                })
-                # Reset for the next block
-                current_block_chunks = []
-
-        # If there are any leftover chunks, create a final block from them
-        if current_block_chunks:
-            content = " ".join(c['content'] for c in current_block_chunks)
-            start_time = current_block_chunks[0]['start']
-            end_time = current_block_chunks[-1]['end']
-            logical_blocks.append({
-                "start": start_time,
-                "end": end_time,
-                "content": content
-            })
+        final_starts, final_ends, final_contents = [], [], []
+        # Bound methods are hoisted out of the loop; this runs once per logical block.
+        add_start, add_end, add_content = final_starts.append, final_ends.append, final_contents.append
+        split_sentences = _SENTENCE_SPLIT_RE.split
+
+        for start, end, content in self.iter_logical_blocks(chunks):
+            content = content.strip()
+            if not content: continue
+            sentences = [s for s in split_sentences(content) if s]
+
+            # Sentences within a block are contiguous, so only the previous block's last entry can overlap.
+            if final_ends and final_ends[-1] > start: final_ends[-1] = start
+            if len(sentences) <= 1:
+                add_start(start); add_end(end); add_content(content)
+                continue
             
-        return logical_blocks
+            total_len = sum(map(len, sentences))
+            duration = end - start
+            if duration < 0: duration = 0
+            # Each sentence ends at its cumulative share of the block, so rounding never drifts past the block end.
+            current_time, current_len = start, 0
+            for sentence in sentences:
+                current_len += len(sentence)
+                sentence_end_time = start + duration * current_len // total_len
+                add_start(current_time); add_end(sentence_end_time); add_content(sentence)
+                current_time = sentence_end_time
+        return final_starts, final_ends, final_contents
 
     @Slot()
     def run(self):
         """The main work loop for the thread."""
         self.log_message.emit("\n--- Starting New Batch ---")
         os.makedirs(self.output_dir, exist_ok=True)
-        for task in self.tasks:
-            try:
-                if task['type'] == 'url':
-                    self.process_youtube_url(task['value'])
-                elif task['type'] == 'file':
-                    self.process_local_srt_file(task['value'])
-                self.log_message.emit("-" * 25)
-            except Exception as e:
-                self.log_message.emit(f"[!!!] CRITICAL ERROR on {task['value']}: {e}")
+        url_count = sum(1 for task in self.tasks if task['type'] == 'url')
+        try:
+            # URL tasks are network-bound, so they are all submitted up front and run concurrently; local files are
+            # CPU-bound and run on this thread. Each task's log is emitted as one block, in input order.
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_URL_WORKERS, url_count))) as executor:
+                url_logs = {i: executor.submit(self.run_task, self.process_youtube_url, task['value'])
+                            for i, task in enumerate(self.tasks) if task['type'] == 'url'}
+                for i, task in enumerate(self.tasks):
+                    if i in url_logs:
+                        self.log_message.emit(url_logs[i].result())
+                    elif task['type'] == 'file':
+                        self.log_message.emit(self.run_task(self.process_local_srt_file, task['value']))
+        finally:
+            self.session.close()
         self.finished.emit()
 
-    def process_youtube_url(self, video_url: str):
-        self.log_message.emit(f"[*] Processing URL: {video_url}")
+    def run_task(self, handler, value: str) -> str:
+        """Runs one task, collecting its log lines so concurrent tasks never interleave."""
+        lines = []
+        try:
+            handler(value, lines.append)
+            lines.append("-" * 25)
+        except Exception as e:
+            lines.append(f"[!!!] CRITICAL ERROR on {value}: {e}")
+        return "\n".join(lines)
+
+    def process_youtube_url(self, video_url: str, log):
+        log(f"[*] Processing URL: {video_url}")
         video_id = get_video_id(video_url)
-        if not video_id: self.log_message.emit(f"[!] Invalid YouTube URL, skipping."); return
+        if not video_id: log(f"[!] Invalid YouTube URL, skipping: {video_url}"); return
 
-        with yt_dlp.YoutubeDL({'quiet': True, 'skip_download': True, 'writeautomaticsub': True, 'subtitleslangs': ['en']}) as ydl:
+        # Only the subtitle tracks are needed, so skip the DASH/HLS manifest requests and format probing.
+        ydl_opts = {'quiet': True, 'skip_download': True, 'writeautomaticsub': True, 'subtitleslangs': ['en'],
+                    'youtube_include_dash_manifest': False, 'youtube_include_hls_manifest': False, 'check_formats': False}
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(video_url, download=False)
         title = info.get('title', 'N/A')
         
         subtitle_url, source = self.find_subtitle_url(info)
-        if not subtitle_url: self.log_message.emit(f"[!] No English subtitles found for '{title}'"); return
-        self.log_message.emit(f"    > Found {source} subtitles for '{title}'")
-        
-        response = requests.get(subtitle_url)
-        root = ET.fromstring(response.text)
-        namespaces = {'ttml': 'http://www.w3.org/ns/ttml'}
+        if not subtitle_url: log(f"[!] No English subtitles found for '{title}' ({video_url})"); return
+        log(f"    > Found {source} subtitles for '{title}'")
         
-        raw_chunks = [
-            {"start": parse_time(p.attrib['begin']), "end": parse_time(p.attrib['end']), "content": " ".join(p.text.strip().split())}
-            for p in root.findall('.//ttml:p', namespaces) if p.text and p.attrib.get('begin')
-        ]
+        # Stream the TTML and handle each <p> as soon as it is parsed. Finished children are detached from
+        # their parent, so only the open ancestors of the current element stay in memory.
+        p_tag = '{http://www.w3.org/ns/ttml}p'
+        raw_chunks = []
+        open_elements = []
+        with self.session.get(subtitle_url, stream=True, timeout=30) as response:
+            response.raw.decode_content = True
+            for event, p in ET.iterparse(response.raw, events=('start', 'end')):
+                if event == 'start': open_elements.append(p); continue
+                open_elements.pop()
+                if p.tag != p_tag: continue
+                if p.text and p.attrib.get('begin'):
+                    raw_chunks.append((parse_time(p.attrib['begin']), parse_time(p.attrib['end']), _WHITESPACE_RE.sub(" ", p.text).strip()))
+                # Every earlier sibling has already ended, so the parent's children can all be dropped.
+                if open_elements: del open_elements[-1][:]
         
-        logical_blocks = self.create_logical_blocks(raw_chunks)
-        final_entries = self.split_into_sentences(logical_blocks)
-        self.enforce_no_overlap(final_entries)
+        starts, ends, contents = self.build_final_entries(raw_chunks)
         
-        output_path = os.path.join(self.output_dir, f"{video_id}.srt")
-        write_srt_file(final_entries, output_path)
-        self.log_message.emit(f"    > SUCCESS: Rearranged and created file: {output_path}")
+        output_path = self._out_prefix + video_id + ".srt"
+        write_srt_file(starts, ends, contents, output_path)
+        log(f"    > SUCCESS: Rearranged and created file: {output_path}")
 
     def find_subtitle_url(self, info):
-        subs_info = info.get('subtitles') or info.get('automatic_captions')
-        source = "manual" if 'subtitles' in info else "auto-generated"
-        if subs_info and 'en' in subs_info:
-            for sub_format in subs_info['en']:
-                if sub_format['ext'] == 'ttml': return sub_format['url'], source
+        # Prefer manual subtitles, falling back to auto-generated ones when no English TTML track exists.
+        for key, source in (('subtitles', "manual"), ('automatic_captions', "auto-generated")):
+            urls_by_ext = {}
+            for fmt in (info.get(key) or {}).get('en', []):
+                if fmt.get('url'): urls_by_ext.setdefault(fmt.get('ext'), fmt['url'])
+            url = urls_by_ext.get('ttml')
+            if url: return url, source
         return None, None
 
-    def process_local_srt_file(self, filepath: str):
-        self.log_message.emit(f"[*] Processing local file: {filepath}")
-        with open(filepath, 'r', encoding='utf-8') as f: content = f.read()
-        
-        srt_pattern = re.compile(r'\d+\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n(.*?)\n\n', re.DOTALL)
-        
-        raw_chunks = [
-            {"start": parse_time(m.group(1)), "end": parse_time(m.group(2)), "content": " ".join(m.group(3).strip().split('\n'))}
-            for m in srt_pattern.finditer(content)
-        ]
-        
-        if not raw_chunks: self.log_message.emit(f"[!] No valid entries found in {os.path.basename(filepath)}"); return
-        
-        logical_blocks = self.create_logical_blocks(raw_chunks)
-        final_entries = self.split_into_sentences(logical_blocks)
-        self.enforce_no_overlap(final_entries)
+    def process_local_srt_file(self, filepath: str, log):
+        log(f"[*] Processing local file: {filepath}")
+        starts, ends, contents = self.build_final_entries(iter_srt_file(filepath))
         
         filename = os.path.basename(filepath)
-        output_path = os.path.join(self.output_dir, filename)
+        if not contents: log(f"[!] No valid entries found in {filename}"); return
+        
+        output_path = self._out_prefix + filename
         
-        write_srt_file(final_entries, output_path)
-        self.log_message.emit(f"    > SUCCESS: Rearranged and created new file: {output_path}")
+        write_srt_file(starts, ends, contents, output_path)
+        log(f"    > SUCCESS: Rearranged and created new file: {output_path}")
 
 # --- FRONTEND LOGIC (PySide6 UI) ---
 